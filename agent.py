@@ -1,11 +1,8 @@
-import openai
-from openai import OpenAI
 import random
-
-client = OpenAI(
-    base_url="XXXXXXX",
-    api_key="your api key",
-)
+import re
+import threading
+from profiling import incr, profiled
+from router import default_router as router
 
 EVALUATION_PROMPTS = {
     "Product Manager": [
@@ -31,13 +28,145 @@ EVALUATION_PROMPTS = {
 }
 
 
+class GenerationAborted(Exception):
+    """
+    Raised when a streaming validator rejects a partial generation.
+    """
+
+
+HEADING_STOPWORDS = {"a", "an", "and", "for", "of", "or", "the", "to"}
+
+
+def _heading_keywords(heading):
+    """
+    Key words of a heading, ignoring parentheticals and stop words:
+    "PRD (Product Requirement Document) Clarification" -> {"prd", "clarification"}.
+    """
+    words = re.findall(r"\w+", re.sub(r"\(.*?\)", " ", heading).lower())
+    return {w for w in words if w not in HEADING_STOPWORDS}
+
+
+def sop_heading_validator(sop_template, after_tokens=64, headings=None):
+    """
+    Build a streaming validator that aborts a generation whose first
+    `after_tokens` tokens (or whole reply, if shorter) do not mention the SOP
+    heading. A heading counts as mentioned when at least half of its key words
+    appear, so "PRD Clarification" satisfies the Product Manager template.
+    headings: accepted heading phrases; defaults to the template's first line.
+    """
+    if headings is None:
+        headings = [sop_template.strip().splitlines()[0].rstrip(":")]
+    keyword_sets = [k for k in map(_heading_keywords, headings) if k]
+
+    def validate(partial_text, num_tokens, final=False):
+        # Checked exactly once: at `after_tokens`, or at the end of a shorter reply.
+        due = num_tokens < after_tokens if final else num_tokens == after_tokens
+        if not due or not keyword_sets:
+            return None
+        words = set(re.findall(r"\w+", partial_text.lower()))
+        if any(2 * len(keywords & words) >= len(keywords) for keywords in keyword_sets):
+            return None
+        return f"missing SOP heading '{headings[0]}'"
+
+    return validate
+
+
+_partial_lines = {}  # agent_name -> streamed text not yet printed
+_partial_lock = threading.Lock()
+
+
+def print_partial(agent_name, delta):
+    """
+    Default streaming sink: echo streamed text to the console line by line,
+    prefixed with the agent name so concurrent streams stay readable.
+    """
+    with _partial_lock:
+        *lines, rest = (_partial_lines.pop(agent_name, "") + delta).split("\n")
+        for line in lines:
+            print(f"[{agent_name}] {line}", flush=True)
+        if rest:
+            _partial_lines[agent_name] = rest
+
+
 class Agent:
-    def __init__(self, name, role, sop_template):
+    def __init__(self, name, role, sop_template, stream=False, max_output_tokens=None,
+                 validators=None, on_partial=None):
+        """
+        stream: consume completions token by token instead of waiting for the full reply.
+        max_output_tokens: hard cap on proposal length (also sent as max_tokens).
+        validators: callables (partial_text, num_tokens, final=False) -> abort reason or None,
+            checked after every streamed token and once more with final=True when the
+            stream ends. An aborted initial generation sets `aborted` so callers can skip
+            scoring it.
+        on_partial: callable (agent_name, delta) receiving streamed text; defaults to console echo.
+        """
         self.name = name
         self.role = role
         self.sop_template = sop_template
         self.current_proposal = ""
+        self.aborted = False  # last generation was stopped by a streaming validator
+        self.stream = stream
+        self.max_output_tokens = max_output_tokens
+        self.validators = list(validators or [])
+        self.on_partial = on_partial or print_partial
+
+    def _complete(self, system_message, user_message, phase):
+        """
+        Run one proposal completion, streaming it if enabled.
+        """
+        messages = [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": user_message}
+        ]
+        kwargs = {}
+        if self.max_output_tokens:
+            kwargs["max_tokens"] = self.max_output_tokens
+        if not self.stream:
+            return router.complete(phase, messages, **kwargs)
+        return self._stream_completion(messages, phase, **kwargs)
+
+    def _check_validators(self, text, num_tokens, phase, final=False):
+        for validator in self.validators:
+            reason = validator(text, num_tokens, final=final)
+            if reason:
+                incr("aborted_generations", phase=phase)
+                raise GenerationAborted(f"{reason} after {num_tokens} tokens")
+
+    def _stream_completion(self, messages, phase, **kwargs):
+        """
+        Stream a completion, forwarding partial text to `on_partial`,
+        enforcing `max_output_tokens` and aborting on the first validator failure.
+        """
+        stream = router.create(phase, messages, stream=True, **kwargs)
+        text = ""
+        num_tokens = 0
+        truncated = False
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                text += delta
+                num_tokens += 1
+                self.on_partial(self.name, delta)
+                self._check_validators(text, num_tokens, phase)
+                if self.max_output_tokens and num_tokens >= self.max_output_tokens:
+                    truncated = True
+                    break
+            self._check_validators(text, num_tokens, phase, final=True)
+        finally:
+            if text and not text.endswith("\n"):
+                self.on_partial(self.name, "\n")  # flush the last partial line
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+        if truncated:
+            self.on_partial(self.name, f"[Truncated] reached {self.max_output_tokens} output tokens\n")
+        return text.strip()
 
+    @profiled("generate")
     def generate_proposal(self, task_description):
         """
         CAB round 1 proposal generation.
@@ -48,20 +177,21 @@ class Agent:
             f"SOP Guidelines: {self.sop_template}\n"
             f"Please provide a structured and thoughtful proposal for your role."
         )
+        self.aborted = False
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o-2024-05-13",
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": user_message}
-                ],
-            )
-            self.current_proposal = response.choices[0].message.content.strip()
+            self.current_proposal = self._complete(system_message, user_message, "generate")
+        except GenerationAborted as e:
+            # Marked so CAB skips scoring and feedback instead of spending calls on a placeholder.
+            print(f"[Abort] Proposal generation aborted for {self.name}: {e}")
+            self.aborted = True
+            self.current_proposal = f"[Aborted] Initial proposal by {self.name}"
         except Exception as e:
             print(f"[Error] Proposal generation failed for {self.name}: {e}")
+            incr("fallbacks", phase="generate")
             self.current_proposal = f"[Fallback] Initial proposal by {self.name}"
         return self.current_proposal
 
+    @profiled("refine")
     def refine_proposal(self, feedback):
         """
         CAB refinement after feedback from coordinator.
@@ -72,20 +202,21 @@ class Agent:
             f"Feedback:\n{feedback}\n\n"
             "Revise your proposal accordingly."
         )
+        self.aborted = False
+        previous = self.current_proposal
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o-2024-05-13",
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": user_message}
-                ],
-            )
-            self.current_proposal = response.choices[0].message.content.strip()
+            self.current_proposal = self._complete(system_message, user_message, "refine")
+        except GenerationAborted as e:
+            # The previous proposal is still valid (and its score memoized), so keep it.
+            print(f"[Abort] Refinement aborted for {self.name}, keeping previous proposal: {e}")
+            self.current_proposal = previous
         except Exception as e:
             print(f"[Error] Refinement failed for {self.name}: {e}")
+            incr("fallbacks", phase="refine")
             self.current_proposal = f"[Fallback] Refined draft by {self.name}"
         return self.current_proposal
 
+    @profiled("evaluate_peers")
     def evaluate_peers(self, peer_proposals):
         """
         DCC peer evaluation: score others using role-based criteria.
@@ -104,18 +235,16 @@ class Agent:
                     "Please provide a concise and critical evaluation."
                 )
                 try:
-                    response = client.chat.completions.create(
-                        model="gpt-4o-2024-05-13",
-                        messages=[
-                            {"role": "system", "content": f"You are a {self.role} evaluating peer proposals."},
-                            {"role": "user", "content": message}
-                        ],
-                    )
-                    evaluations[peer_name][criterion] = response.choices[0].message.content.strip()
+                    evaluations[peer_name][criterion] = router.complete("peer_eval", [
+                        {"role": "system", "content": f"You are a {self.role} evaluating peer proposals."},
+                        {"role": "user", "content": message}
+                    ], validate=bool)
                 except Exception as e:
+                    incr("fallbacks", phase="peer_eval")
                     evaluations[peer_name][criterion] = f"[Evaluation failed: {e}]"
         return evaluations
 
+    @profiled("evolve")
     def evolve_from_peers(self, peer_proposals, peer_scores):
         """
         DCC-style evolution: analyze peer proposals and revise current_proposal accordingly.
@@ -132,16 +261,13 @@ class Agent:
             "Identify two useful strategies or techniques, incorporate them into your solution, and justify the changes."
         )
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o-2024-05-13",
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": user_message}
-                ],
-            )
-            self.current_proposal = response.choices[0].message.content.strip()
+            self.current_proposal = router.complete("evolve", [
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": user_message}
+            ])
         except Exception as e:
             print(f"[Error] Evolution failed for {self.name}: {e}")
+            incr("fallbacks", phase="evolve")
             self.current_proposal = f"[Fallback] Evolved version by {self.name}"
         return self.current_proposal
 
@@ -149,20 +275,20 @@ class Agent:
 # Specialized roles
 
 class ProductManagerAgent(Agent):
-    def __init__(self, name, sop_template):
-        super().__init__(name, "Product Manager", sop_template)
+    def __init__(self, name, sop_template, **kwargs):
+        super().__init__(name, "Product Manager", sop_template, **kwargs)
 
 
 class ArchitectAgent(Agent):
-    def __init__(self, name, sop_template):
-        super().__init__(name, "Architect", sop_template)
+    def __init__(self, name, sop_template, **kwargs):
+        super().__init__(name, "Architect", sop_template, **kwargs)
 
 
 class EngineerAgent(Agent):
-    def __init__(self, name, sop_template):
-        super().__init__(name, "Engineer", sop_template)
+    def __init__(self, name, sop_template, **kwargs):
+        super().__init__(name, "Engineer", sop_template, **kwargs)
 
 
 class QAEngineerAgent(Agent):
-    def __init__(self, name, sop_template):
-        super().__init__(name, "QA Engineer", sop_template)
+    def __init__(self, name, sop_template, **kwargs):
+        super().__init__(name, "QA Engineer", sop_template, **kwargs)
@@ -1,19 +1,23 @@
 import ast
 import difflib
-import json
+import math
 from itertools import combinations
 import numpy as np
-import openai
-from openai import OpenAI
+from profiling import incr, profiled, span
+from proposal_pool import Proposal
+from router import default_router as router
+from structured_output import call_json
 
-# ============ OPENAI SETUP ============
-client = OpenAI(
-    base_url="XXXXXX",
-    api_key="your api key",
-)
+# Schema for LLM metric replies: each metric scored on the 1-10 rubric scale.
+METRICS_SCHEMA = {
+    "novelty": {"type": "number", "min": 1, "max": 10},
+    "executability": {"type": "number", "min": 1, "max": 10},
+    "diversity": {"type": "number", "min": 1, "max": 10},
+}
 
 # ============ STATIC SCORING TOOLS ============
 
+@profiled("static_analysis")
 def compute_ast_similarity(code1: str, code2: str) -> float:
     try:
         tree1 = ast.dump(ast.parse(code1))
@@ -32,6 +36,7 @@ def compute_diversity(code_samples: list) -> float:
     distances = [1.0 - compute_ast_similarity(a, b) for a, b in combinations(code_samples, 2)]
     return float(np.mean(distances))
 
+@profiled("static_analysis")
 def compute_executability(code: str) -> float:
     try:
         exec_globals = {}
@@ -42,17 +47,31 @@ def compute_executability(code: str) -> float:
 
 # ============ AUCTION COORDINATOR ============
 
+# Bump whenever the scoring prompt changes so memoized scores are invalidated.
+RUBRIC_VERSION = "metrics-v1"
+
+
 class AuctionCoordinator:
     """
     Central evaluator and feedback generator in CAB or peer evaluation in DCC.
     """
-    def __init__(self, weights):
+    def __init__(self, weights, score_cache=None, num_samples=1, calibrator=None,
+                 rubric_version=RUBRIC_VERSION):
         """
         weights: dict mapping metric name -> weight for final score.
+        score_cache: optional ScoreCache reusing scores of unchanged proposals (across runs if persisted).
+        num_samples: number of LLM scoring samples averaged per proposal.
+        calibrator: optional ScoreCalibrator normalizing per-run score drift.
         """
         self.weights = weights
+        self.score_cache = score_cache
+        self.num_samples = max(1, num_samples)
+        self.calibrator = calibrator
+        # Memo keys also name the scoring cascade's models, so changing the routing invalidates them.
+        self.rubric_version = f"{rubric_version}@{'>'.join(tier.model for tier in router.cascade('score'))}"
+        self.fallback_count = 0
 
-    def _safe_call_gpt_metrics(self, proposal, task_description):
+    def _call_gpt_metrics(self, proposal, task_description):
         system_message = "You are an expert software reviewer evaluating proposals based on standard metrics."
         user_message = (
             f"Task: {task_description}\n"
@@ -64,38 +83,112 @@ class AuctionCoordinator:
             "Respond ONLY with JSON like:\n"
             "{\"novelty\": 8, \"executability\": 7, \"diversity\": 6}"
         )
+        return call_json(router, "score", [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": user_message}
+        ], METRICS_SCHEMA, name="metrics")
+
+    def _safe_call_gpt_metrics(self, proposal, task_description):
+        """
+        One GPT scoring sample as {metric: float}, or None if the call or parsing failed.
+        """
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o-2024-05-13",
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": user_message}
-                ],
-            )
-            return json.loads(response.choices[0].message.content.strip())
+            raw = self._call_gpt_metrics(proposal, task_description)
+            return {k: float(v) for k, v in raw.items()}
         except Exception as e:
             print(f"[Fallback] GPT evaluation failed: {e}")
-            return {k: 5 for k in self.weights}  # Neutral fallback
+            incr("fallbacks", phase="score")
+            return None
+
+    def _sample_metrics(self, proposal, task_description):
+        """
+        Average `num_samples` GPT scores. Returns (metrics, variance), or (None, None) if every sample failed.
+        """
+        samples = [self._safe_call_gpt_metrics(proposal, task_description) for _ in range(self.num_samples)]
+        samples = [s for s in samples if s is not None]
+        if not samples:
+            return None, None
+        metrics, variance = {}, {}
+        for k in samples[0]:
+            values = [s[k] for s in samples if k in s]
+            metrics[k] = float(np.mean(values))
+            variance[k] = float(np.var(values))
+        return metrics, variance
+
+    def _raw_metrics(self, proposal_content, task_description, fallback_metrics=None):
+        """
+        Uncalibrated metrics for one proposal, reusing memoized scores for unchanged content.
+        Returns (metrics, variance, calibrate). `calibrate` is False for fallback metrics,
+        which are never memoized, and for scores memoized by a previous run, which already
+        belong to the calibrator's reference distribution.
+        """
+        entry = None
+        if self.score_cache is not None:
+            entry = self.score_cache.get(proposal_content, task_description, self.rubric_version,
+                                         min_samples=self.num_samples)
+        if entry is not None:
+            incr("score_cache_hits")
+            previous_run = self.score_cache.from_previous_run(proposal_content, task_description,
+                                                              self.rubric_version)
+            return entry["metrics"], entry["variance"], not previous_run
+        metrics, variance = self._sample_metrics(proposal_content, task_description)
+        if metrics is None:
+            self.fallback_count += 1
+            incr("neutral_scores")
+            if fallback_metrics:
+                return fallback_metrics, {}, False
+            print("[Fallback] Using neutral scores.")
+            return {k: 5 for k in self.weights}, {}, False
+        if self.score_cache is not None:
+            self.score_cache.put(proposal_content, task_description, self.rubric_version,
+                                 metrics, variance, self.num_samples)
+        if self.calibrator is not None:
+            self.calibrator.observe(metrics)
+        return metrics, variance, True
+
+    def _end_round(self):
+        """
+        Fold this round's scores into the calibration statistics and persist the score memo.
+        """
+        if self.calibrator is not None:
+            self.calibrator.end_round()
+        if self.score_cache is not None and self.score_cache.path:
+            self.score_cache.save()
+
+    def evaluate_proposal_with_variance(self, proposal_content, task_description, fallback_metrics=None):
+        """
+        Evaluate one proposal. Returns (metrics, variance); failed scoring is never memoized.
+        Calibration uses the statistics frozen at the end of the previous round.
+        """
+        metrics, variance, calibrate = self._raw_metrics(proposal_content, task_description, fallback_metrics)
+        if calibrate and self.calibrator is not None:
+            metrics = self.calibrator.calibrate(metrics)
+        return metrics, variance
 
     def evaluate_proposal(self, proposal_content, task_description, fallback_metrics=None):
         """
         Evaluate one proposal and return full metric dict.
         Optionally fallback to static scoring if GPT fails.
         """
-        metrics = self._safe_call_gpt_metrics(proposal_content, task_description)
-        if not metrics and fallback_metrics:
-            return fallback_metrics
+        metrics, _ = self.evaluate_proposal_with_variance(proposal_content, task_description, fallback_metrics)
         return metrics
 
+    @profiled("score")
     def score_proposals(self, proposals, task_description):
         """
-        Annotate proposal.score and proposal.metrics using weighted metric aggregation.
+        Annotate proposal.score, proposal.metrics and proposal.metric_variance using weighted metric aggregation.
+        The whole round is scored on one scale: every proposal is calibrated against the statistics
+        frozen at the end of the previous round, and this round's raw scores only enter them afterwards.
+        Aborted proposals are left unscored.
         """
-        for proposal in proposals:
-            metrics = self.evaluate_proposal(proposal.content, task_description)
-            proposal.metrics = metrics
-            proposal.score = sum(self.weights.get(k, 0) * metrics.get(k, 0) for k in self.weights)
+        scored = [p for p in proposals if not p.aborted]
+        for proposal in scored:
+            proposal.metrics, proposal.metric_variance = self.evaluate_proposal_with_variance(
+                proposal.content, task_description)
+            proposal.score = sum(self.weights.get(k, 0) * proposal.metrics.get(k, 0) for k in self.weights)
+        self._end_round()
 
+    @profiled("score")
     def evaluate_multiple(self, proposal_dict: dict, task_description: str):
         """
         For DCC peer-eval. Input: dict {agent_name: proposal_text}
@@ -105,14 +198,20 @@ class AuctionCoordinator:
         for name, content in proposal_dict.items():
             metrics = self.evaluate_proposal(content, task_description)
             result[name] = metrics
+        self._end_round()
         return result
 
     def select_winner(self, proposals):
         """
-        Return proposal with highest .score.
+        Return proposal with highest .score, ignoring aborted proposals (None if there are none left).
         """
-        return max(proposals, key=lambda p: p.score if p.score is not None else -1)
+        with span("select"):
+            candidates = [p for p in proposals if not p.aborted]
+            if not candidates:
+                return None
+            return max(candidates, key=lambda p: p.score if p.score is not None else -1)
 
+    @profiled("feedback")
     def generate_feedback(self, losing_proposal, winning_proposal, task_description):
         """
         Structured GPT feedback from losing to winning proposal.
@@ -126,14 +225,136 @@ class AuctionCoordinator:
             "Highlight how it differs from the winner and what can be better."
         )
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o-2024-05-13",
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": user_message}
-                ],
-            )
-            return response.choices[0].message.content.strip()
+            return router.complete("feedback", [
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": user_message}
+            ])
         except Exception as e:
             print(f"[Fallback] Feedback generation failed: {e}")
+            incr("fallbacks", phase="feedback")
             return "Improve clarity, feasibility, and innovation in your proposal based on peer comparison."
+
+
+# ============ SUCCESSIVE-HALVING SCHEDULER ============
+
+# Refinement instruction for the current leader, which gets no comparative feedback.
+LEADER_FEEDBACK = ("Your proposal currently leads the auction. Strengthen it further: "
+                   "tighten weak sections, resolve open risks and keep what already works.")
+
+
+def cab_call_cost(num_agents: int, iterations: int, num_samples: int = 1) -> int:
+    """
+    Nominal LLM calls of a plain CAB stage: every agent generates and is scored
+    (`num_samples` calls each) every iteration, and every loser receives feedback.
+    Escalations, repair retries and score-cache hits are not included.
+    """
+    return iterations * (num_agents * (2 + num_samples) - 1)
+
+
+class SuccessiveHalvingScheduler:
+    """
+    Auction scheduler on top of AuctionCoordinator.select_winner.
+    Starts with every agent, prunes the lowest-scoring fraction each round and
+    spends the calls saved on further refinement rounds for the leaders.
+    """
+    def __init__(self, coordinator, drop_fraction=0.5, min_survivors=2, max_rounds=None):
+        """
+        drop_fraction: share of the active field pruned after each round.
+        min_survivors: field size below which no more agents are pruned.
+        max_rounds: optional hard cap on rounds, independent of the call budget.
+        """
+        self.coordinator = coordinator
+        self.drop_fraction = drop_fraction
+        self.min_survivors = max(1, min_survivors)
+        self.max_rounds = max_rounds
+
+    def _num_survivors(self, field_size):
+        if field_size <= self.min_survivors:
+            return field_size
+        keep = math.ceil(field_size * (1.0 - self.drop_fraction))
+        return min(field_size, max(self.min_survivors, keep))
+
+    def run(self, agents, task_description, max_iter=5, log=print):
+        """
+        Run the auction with a call budget equal to a plain CAB stage of `max_iter` iterations.
+        After round 1 every survivor, the leader included, refines and is re-scored each round.
+        Calls are measured on the router's tiers, so escalations, repair retries, cache hits
+        and unscored aborted proposals are reflected in the accounting.
+        Returns (winning Proposal, report dict with per-round pruning decisions and call accounting).
+        """
+        budget = cab_call_cost(len(agents), max_iter, self.coordinator.num_samples)
+        start_calls = router.total_calls()
+        calls_reinvested = 0  # calls spent in rounds beyond max_iter
+        rounds = []
+        active = list(agents)
+        current = {}   # agent_name -> Proposal scored in the latest round
+        feedback = {}  # agent_name -> feedback to refine with next round
+        winner = None
+        round_num = 0
+
+        while active:
+            round_num += 1
+            round_start = router.total_calls()
+            log(f"\n=== Successive Halving - Round {round_num} ({len(active)} agents) ===")
+
+            for agent in active:
+                if round_num == 1:
+                    text = agent.generate_proposal(task_description)
+                else:
+                    text = agent.refine_proposal(feedback.get(agent.name, LEADER_FEEDBACK))
+                current[agent.name] = Proposal(agent.name, text, version=round_num - 1, aborted=agent.aborted)
+            field = [current[agent.name] for agent in active]
+            self.coordinator.score_proposals(field, task_description)
+            field_calls = router.total_calls() - round_start
+
+            winner = self.coordinator.select_winner(field)
+            if winner is None:
+                log("⚠️ Every proposal was aborted.")
+                break
+            ranked = sorted((p for p in field if not p.aborted), key=lambda p: p.score, reverse=True)
+            keep = self._num_survivors(len(ranked))
+            survivors = [p.agent_name for p in ranked[:keep]]
+            pruned = [p.agent_name for p in ranked[keep:]] + [p.agent_name for p in field if p.aborted]
+            rounds.append({
+                "round": round_num,
+                "scores": {p.agent_name: p.score for p in field},
+                "winner": winner.agent_name,
+                "survivors": survivors,
+                "pruned": pruned,
+            })
+            log(f"🏆 Leader: {winner.agent_name} (Score: {winner.score:.2f})")
+            if pruned:
+                log(f"✂️ Pruned: {', '.join(pruned)}")
+
+            active = [agent for agent in active if agent.name in survivors]
+            # Next round: feedback for each non-leader, then refine + score for every survivor,
+            # estimated at this round's measured calls per proposal.
+            next_cost = math.ceil(field_calls / len(field) * len(active)) + len(active) - 1
+            stop = (len(active) < 2 or router.total_calls() - start_calls + next_cost > budget
+                    or (self.max_rounds and round_num >= self.max_rounds))
+            if not stop:
+                feedback = {}
+                for name in survivors:
+                    if name != winner.agent_name:
+                        feedback[name] = self.coordinator.generate_feedback(current[name], winner, task_description)
+            round_calls = router.total_calls() - round_start
+            rounds[-1]["calls"] = round_calls
+            if round_num > max_iter:
+                calls_reinvested += round_calls
+            if stop:
+                break
+
+        calls_used = router.total_calls() - start_calls
+
+        report = {
+            "rounds": rounds,
+            "num_rounds": round_num,
+            "calls_used": calls_used,
+            "call_budget": budget,
+            "calls_saved": budget - calls_used,
+            "calls_reinvested": calls_reinvested,
+        }
+        log(f"[Successive Halving] {round_num} rounds, {calls_used} calls vs {budget} nominal for plain CAB "
+            f"({max_iter} iterations): saved {budget - calls_used}, "
+            f"{calls_reinvested} reinvested in rounds beyond {max_iter}")
+        return winner, report
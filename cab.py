@@ -1,4 +1,6 @@
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from openai import OpenAI
 from agent import (
@@ -9,7 +11,10 @@ from agent import (
 )
 from sop_templates import SOP_TEMPLATES
 from proposal_pool import Proposal, ProposalPool
-from auction import AuctionCoordinator
+from auction import AuctionCoordinator, SuccessiveHalvingScheduler
+from profiling import profiled, span
+from router import default_router
+from structured_output import PARSE_STATS
 
 # === Setup ===
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -22,65 +27,178 @@ client = OpenAI(
 )
 
 def log_and_print(message, f):
-    print(message)
-    f.write(message + "\n")
+    with span("log"):
+        print(message)
+        f.write(message + "\n")
 
-def run_cab_stage(agents, task_input, role_name, auction_coordinator, f, max_iter=5):
+def _speculative_refine(agent, proposal, predicted_winner, task_input, auction_coordinator):
+    """
+    Feedback + refinement for a likely loser against the predicted winner, computed
+    while scoring is still in flight. The agent's current proposal is left untouched.
+    Returns (feedback, refined proposal text, wall-clock finish time).
+    """
+    with span("speculate"):
+        feedback = auction_coordinator.generate_feedback(proposal, predicted_winner, task_input)
+        previous = agent.current_proposal
+        try:
+            refined = agent.refine_proposal(feedback)
+        finally:
+            agent.current_proposal = previous
+    return feedback, refined, time.perf_counter()
+
+
+@profiled("cab_stage")
+def run_cab_stage(agents, task_input, role_name, auction_coordinator, f, max_iter=5,
+                  speculative=False, speculation_margin=0.5):
     """
     Run a full CAB stage for one role group (e.g., Engineers), including proposal refinement and feedback loop.
     Returns the final winning proposal content to pass to next role.
+
+    speculative: while proposals are being scored, agents whose previous-round score trailed
+    the previous leader by more than `speculation_margin` already request feedback against the
+    leader's new proposal and refine. The results are kept if the leader wins again and discarded otherwise.
     """
     proposal_dict = {}     # agent_name -> latest proposal string
     last_losers = []       # agent names that lost previous round
     last_feedback = {}     # agent_name -> feedback string
+    last_scores = {}       # agent_name -> previous-round score
+    speculated = {}        # agent_name -> refined proposal accepted from speculation
+    # Wall-clock accounting: speculative work overlapping scoring, split by whether it was
+    # kept (latency saved) or discarded, plus time blocked on workers once scoring ended.
+    spec_stats = {"attempts": 0, "hits": 0, "overlap_kept": 0.0, "overlap_discarded": 0.0, "blocked": 0.0}
+    executor = ThreadPoolExecutor(max_workers=max(1, len(agents))) if speculative else None
+    winner = None
 
-    for iteration in range(1, max_iter + 1):
-        log_and_print(f"\n=== {role_name} Stage - Iteration {iteration} ===", f)
+    try:
+        for iteration in range(1, max_iter + 1):
+            log_and_print(f"\n=== {role_name} Stage - Iteration {iteration} ===", f)
 
-        pool = ProposalPool()
+            pool = ProposalPool()
 
-        for agent in agents:
-            if agent.name in last_losers:
-                previous = proposal_dict.get(agent.name, "")
-                feedback = last_feedback.get(agent.name, "")
-                proposal_text = agent.refine_proposal(feedback, previous)
-            else:
-                proposal_text = agent.generate_proposal(task_input)
-
-            proposal_dict[agent.name] = proposal_text
-            pool.add(Proposal(agent.name, proposal_text))
-
-            log_and_print(f"[{agent.name}] Proposal:\n{proposal_text}\n", f)
-
-        # === Scoring ===
-        auction_coordinator.score_proposals(pool.get_all(), task_input)
-
-        for p in pool.get_all():
-            m = p.metrics
-            log_and_print(f"{p.agent_name} scores -> Novelty: {m.get('novelty')}, Executability: {m.get('executability')}, Diversity: {m.get('diversity')}, Total: {p.score:.2f}", f)
-
-        # === Winner Selection ===
-        winner = auction_coordinator.select_winner(pool.get_all())
-        if winner:
-            log_and_print(f"\n🏆 Winner: {winner.agent_name} (Score: {winner.score:.2f})", f)
-            log_and_print(f"Winning Proposal Content:\n{winner.content}\n", f)
-        else:
-            log_and_print("⚠️ No valid winner selected.", f)
-            break
-
-        # === Generate Feedback ===
-        new_losers = []
-        new_feedback = {}
-        for p in pool.get_all():
-            if p.agent_name != winner.agent_name:
-                feedback = auction_coordinator.generate_feedback(p, winner, task_input)
-                new_feedback[p.agent_name] = feedback
-                new_losers.append(p.agent_name)
-                log_and_print(f"📝 Feedback for {p.agent_name}: {feedback}", f)
+            for agent in agents:
+                if agent.name in speculated:
+                    proposal_text = agent.current_proposal = speculated.pop(agent.name)
+                elif agent.name in last_losers:
+                    proposal_text = agent.refine_proposal(last_feedback.get(agent.name, ""))
+                elif winner is not None and agent.name == winner.agent_name:
+                    # The winner is carried over unchanged, so its memoized score is reused.
+                    proposal_text = agent.current_proposal
+                else:
+                    proposal_text = agent.generate_proposal(task_input)
+
+                proposal_dict[agent.name] = proposal_text
+                pool.add(Proposal(agent.name, proposal_text, aborted=agent.aborted))
+
+                log_and_print(f"[{agent.name}] Proposal:\n{proposal_text}\n", f)
+
+            # === Speculation (runs alongside scoring) ===
+            futures = {}
+            predicted = None
+            if executor and last_scores and iteration < max_iter:
+                predicted_name = max(last_scores, key=last_scores.get)
+                predicted = next((p for p in pool.get_all() if p.agent_name == predicted_name), None)
+            if predicted is not None and predicted.aborted:
+                predicted = None  # an aborted leader can never win this round
+            if predicted is not None:
+                for p in pool.get_all():
+                    if not p.aborted and last_scores.get(p.agent_name, float("inf")) < last_scores[predicted.agent_name] - speculation_margin:
+                        agent = next(a for a in agents if a.name == p.agent_name)
+                        futures[p.agent_name] = executor.submit(
+                            _speculative_refine, agent, p, predicted, task_input, auction_coordinator)
+
+            # === Scoring ===
+            scoring_start = time.perf_counter()
+            auction_coordinator.score_proposals(pool.get_all(), task_input)
+            scoring_end = time.perf_counter()
+
+            for p in pool.get_all():
+                if p.aborted:
+                    log_and_print(f"{p.agent_name} aborted -> not scored", f)
+                    continue
+                m = p.metrics
+                log_and_print(f"{p.agent_name} scores -> Novelty: {m.get('novelty')}, Executability: {m.get('executability')}, Diversity: {m.get('diversity')}, Total: {p.score:.2f}", f)
+            last_scores = {p.agent_name: p.score for p in pool.get_all() if not p.aborted}
+
+            # === Winner Selection ===
+            winner = auction_coordinator.select_winner(pool.get_all())
+            if winner:
+                log_and_print(f"\n🏆 Winner: {winner.agent_name} (Score: {winner.score:.2f})", f)
+                log_and_print(f"Winning Proposal Content:\n{winner.content}\n", f)
             else:
-                new_feedback[p.agent_name] = ""  # Winner gets no feedback
+                log_and_print("⚠️ No valid winner selected.", f)
+                break
+
+            # === Resolve Speculation ===
+            spec_feedback = {}
+            if futures:
+                hit = winner.agent_name == predicted.agent_name
+                wait_start = time.perf_counter()
+                results = {name: future.result() for name, future in futures.items()}
+                spec_stats["blocked"] += time.perf_counter() - wait_start
+                last_finish = max(finished for _, _, finished in results.values())
+                overlap = max(0.0, min(last_finish, scoring_end) - scoring_start)
+                spec_stats["overlap_kept" if hit else "overlap_discarded"] += overlap
+                spec_stats["attempts"] += len(results)
+                if hit:
+                    spec_stats["hits"] += len(results)
+                    for name, (feedback, refined, _) in results.items():
+                        spec_feedback[name] = feedback
+                        speculated[name] = refined
+                log_and_print(f"🔮 Speculation {'kept' if hit else 'discarded'} for {', '.join(futures)} "
+                              f"(predicted winner: {predicted.agent_name})", f)
+
+            # === Generate Feedback ===
+            new_losers = []
+            new_feedback = {}
+            for p in pool.get_all():
+                if p.aborted:
+                    continue  # regenerates from scratch next iteration
+                if p.agent_name != winner.agent_name:
+                    feedback = spec_feedback.get(p.agent_name)
+                    if feedback is None:
+                        feedback = auction_coordinator.generate_feedback(p, winner, task_input)
+                    new_feedback[p.agent_name] = feedback
+                    new_losers.append(p.agent_name)
+                    log_and_print(f"📝 Feedback for {p.agent_name}: {feedback}", f)
+                else:
+                    new_feedback[p.agent_name] = ""  # Winner gets no feedback
+
+            last_losers = new_losers
+            last_feedback = new_feedback
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+    if executor:
+        attempts = spec_stats["attempts"]
+        hit_rate = spec_stats["hits"] / attempts if attempts else 0.0
+        log_and_print(f"[Speculation] {spec_stats['hits']}/{attempts} hits ({hit_rate:.0%}), "
+                      f"{spec_stats['overlap_kept']:.1f}s wall-clock overlapped with scoring and kept, "
+                      f"{spec_stats['overlap_discarded']:.1f}s overlapped and discarded, "
+                      f"{spec_stats['blocked']:.1f}s blocked waiting on speculation after scoring", f)
+    log_and_print(default_router.report(), f)
+    if PARSE_STATS.counts:
+        log_and_print(PARSE_STATS.report(), f)
+
+    return winner.content if winner else task_input
 
-        last_losers = new_losers
-        last_feedback = new_feedback
 
+@profiled("cab_stage")
+def run_cab_stage_successive_halving(agents, task_input, role_name, auction_coordinator, f,
+                                     max_iter=5, drop_fraction=0.5, min_survivors=2, max_rounds=None):
+    """
+    CAB stage variant that prunes consistently weak agents each round (successive halving)
+    and reinvests the saved calls into extra refinement rounds for the leaders,
+    within the call budget of a plain `max_iter` CAB stage (optionally capped at `max_rounds` rounds).
+    Returns the final winning proposal content to pass to next role.
+    """
+    log_and_print(f"\n=== {role_name} Stage - Successive Halving ===", f)
+    scheduler = SuccessiveHalvingScheduler(auction_coordinator, drop_fraction, min_survivors, max_rounds)
+    winner, report = scheduler.run(agents, task_input, max_iter=max_iter,
+                                   log=lambda message: log_and_print(message, f))
+    for decision in report["rounds"]:
+        if decision["pruned"]:
+            log_and_print(f"Round {decision['round']} pruned: {', '.join(decision['pruned'])}", f)
+    if winner:
+        log_and_print(f"Winning Proposal Content:\n{winner.content}\n", f)
     return winner.content if winner else task_input
@@ -0,0 +1,216 @@
+"""
+Typed, cached index over task files in the dataset.txt format:
+category headers such as "Interactive Mini-Games (20 Tasks)" followed by
+blank-line separated "Title: description" paragraphs.
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import zlib
+from typing import Callable, Dict, Iterator, List, Optional
+
+CATEGORY_RE = re.compile(r"^(?P<category>.+?)\s*\(\d+\s+Tasks?\)\s*$")
+CLAUSE_RE = re.compile(r"[.;]\s+|\d\)\s")
+INDEX_MAGIC = b"C3IDX1"
+
+
+class Task:
+    """
+    One benchmark task with cheap length/complexity features.
+    """
+    def __init__(self, task_id: int, category: str, title: str, description: str):
+        self.task_id = task_id
+        self.category = category
+        self.title = title
+        self.description = description
+        self.num_chars: int = len(description)
+        self.num_words: int = len(description.split())
+        # Sentences, semicolon-separated and numbered requirements.
+        self.num_clauses: int = len([c for c in CLAUSE_RE.split(description) if c.strip()])
+        self.complexity: float = round(self.num_words / 20 + self.num_clauses, 2)
+
+    def to_prompt(self) -> str:
+        """
+        Task text in the form agents receive as task_description.
+        """
+        return f"{self.title}: {self.description}"
+
+    def to_row(self) -> list:
+        return [self.task_id, self.category, self.title, self.description]
+
+    @classmethod
+    def from_row(cls, row: list) -> "Task":
+        return cls(*row)
+
+    def __repr__(self):
+        return (f"<Task(id={self.task_id}, category={self.category}, title={self.title}, "
+                f"words={self.num_words}, complexity={self.complexity})>")
+
+
+def _parse_paragraph(lines: List[str]):
+    text = " ".join(line.strip() for line in lines)
+    title, sep, description = text.partition(":")
+    if not sep:
+        return None
+    return title.strip(), description.strip()
+
+
+def iter_tasks(path: str) -> Iterator[Task]:
+    """
+    Stream tasks from a dataset.txt-format file without loading it whole.
+    Paragraphs before the first category header fall under "Uncategorized".
+    """
+    category = "Uncategorized"
+    paragraph: List[str] = []
+    task_id = 0
+
+    def flush():
+        nonlocal task_id
+        parsed = _parse_paragraph(paragraph)
+        paragraph.clear()
+        if parsed is None:
+            return None
+        task = Task(task_id, category, *parsed)
+        task_id += 1
+        return task
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            stripped = line.strip()
+            header = CATEGORY_RE.match(stripped)
+            if header or not stripped:
+                if paragraph:
+                    task = flush()
+                    if task:
+                        yield task
+                if header:
+                    category = header.group("category")
+                continue
+            paragraph.append(stripped)
+    if paragraph:
+        task = flush()
+        if task:
+            yield task
+
+
+def _file_digest(path: str) -> bytes:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.digest()
+
+
+class TaskIndex:
+    """
+    In-memory index over parsed tasks with per-category lookup and sampling.
+    """
+    def __init__(self, tasks: List[Task]):
+        self.tasks = tasks
+        self.by_category: Dict[str, List[int]] = {}
+        for position, task in enumerate(tasks):
+            self.by_category.setdefault(task.category, []).append(position)
+
+    @classmethod
+    def load(cls, path: str = "dataset.txt", cache_path: Optional[str] = None) -> "TaskIndex":
+        """
+        Load the index from its binary cache (default: `<path>.idx`), re-parsing
+        `path` only when the cache is missing or stale.
+        """
+        cache_path = cache_path or f"{path}.idx"
+        digest = _file_digest(path)
+        if os.path.exists(cache_path):
+            with open(cache_path, "rb") as f:
+                blob = f.read()
+            header_len = len(INDEX_MAGIC) + len(digest)
+            if blob[:len(INDEX_MAGIC)] == INDEX_MAGIC and blob[len(INDEX_MAGIC):header_len] == digest:
+                rows = json.loads(zlib.decompress(blob[header_len:]).decode("utf-8"))
+                return cls([Task.from_row(row) for row in rows])
+        index = cls(list(iter_tasks(path)))
+        index.save(cache_path, digest)
+        return index
+
+    def save(self, cache_path: str, source_digest: bytes):
+        """
+        Write the compact binary index: magic, source digest, zlib-compressed JSON rows.
+        """
+        payload = json.dumps([t.to_row() for t in self.tasks], separators=(",", ":")).encode("utf-8")
+        with open(cache_path, "wb") as f:
+            f.write(INDEX_MAGIC + source_digest + zlib.compress(payload, 9))
+
+    def categories(self) -> List[str]:
+        return list(self.by_category)
+
+    def filter(self, categories: Optional[List[str]] = None, min_complexity: Optional[float] = None,
+               max_complexity: Optional[float] = None,
+               predicate: Optional[Callable[[Task], bool]] = None) -> List[Task]:
+        """
+        Return tasks matching every given condition.
+        """
+        if categories is None:
+            candidates = self.tasks
+        else:
+            candidates = [self.tasks[i] for c in categories for i in self.by_category.get(c, [])]
+        return [
+            t for t in candidates
+            if (min_complexity is None or t.complexity >= min_complexity)
+            and (max_complexity is None or t.complexity <= max_complexity)
+            and (predicate is None or predicate(t))
+        ]
+
+    def sample(self, n: int, seed: Optional[int] = None, **filters) -> List[Task]:
+        """
+        Uniformly sample up to n tasks among those matching `filters` (see `filter`).
+        """
+        candidates = self.filter(**filters)
+        return random.Random(seed).sample(candidates, min(n, len(candidates)))
+
+    def stratified_sample(self, n: int, seed: Optional[int] = None,
+                          categories: Optional[List[str]] = None) -> List[Task]:
+        """
+        Sample n tasks with per-category counts proportional to category size
+        (largest-remainder rounding). When n covers every non-empty category,
+        each gets at least one task first; otherwise the largest categories win.
+        """
+        rng = random.Random(seed)
+        categories = categories or self.categories()
+        sizes = {c: len(self.by_category.get(c, [])) for c in categories}
+        nonempty = [c for c in categories if sizes[c]]
+        total = sum(sizes.values())
+        if total == 0:
+            return []
+        n = min(n, total)
+        counts = {c: 0 for c in categories}
+        if n >= len(nonempty):
+            for c in nonempty:
+                counts[c] = 1
+        remaining = n - sum(counts.values())
+        capacity = {c: sizes[c] - counts[c] for c in categories}
+        total_capacity = sum(capacity.values())
+        if remaining and total_capacity:
+            quotas = {c: remaining * capacity[c] / total_capacity for c in categories}
+            extra = {c: int(q) for c, q in quotas.items()}
+            leftover = remaining - sum(extra.values())
+            for c in sorted(quotas, key=lambda c: extra[c] - quotas[c])[:leftover]:
+                extra[c] += 1
+            for c in categories:
+                counts[c] += extra[c]
+        sampled = []
+        for c in categories:
+            positions = rng.sample(self.by_category.get(c, []), counts[c])
+            sampled.extend(self.tasks[i] for i in positions)
+        return sampled
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def __iter__(self):
+        return iter(self.tasks)
+
+    def __getitem__(self, position: int) -> Task:
+        return self.tasks[position]
+
+    def __repr__(self):
+        return f"<TaskIndex(n={len(self.tasks)}, categories={len(self.by_category)})>"
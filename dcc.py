@@ -3,8 +3,12 @@ from agent import Agent
 import os
 import re
 from openai import OpenAI
+from profiling import profiled
+from topology import CommunicationTopology
 
-def dcc_simulation(task_description, sop_template, roles, max_rounds=5):
+@profiled("dcc_simulation")
+def dcc_simulation(task_description, sop_template, roles, max_rounds=5, topology=None):
+    topology = topology or CommunicationTopology("full")
     agents = [Agent(f"Agent-{i+1}", role, sop_template[role]) for i, role in enumerate(roles)]
     message_pool = {}
 
@@ -16,8 +20,9 @@ def dcc_simulation(task_description, sop_template, roles, max_rounds=5):
     for round_num in range(max_rounds):
         print(f"\n===== Round {round_num + 1} =====")
         converged = True
+        graph = topology.build(message_pool, {a.name: a.utility for a in agents}, round_num)
         for agent in agents:
-            peer_proposals = [p for name, p in message_pool.items() if name != agent.name]
+            peer_proposals = topology.deliver(graph, agent.name, message_pool)
             prev_utility = agent.utility
             refined = agent.refine_proposal(peer_proposals)
             message_pool[agent.name] = refined
@@ -30,6 +35,7 @@ def dcc_simulation(task_description, sop_template, roles, max_rounds=5):
         if converged:
             print("\n[Converged] All agents reached local optima.")
             break
+    print(topology.summary())
 
     final_outputs = sorted(agents, key=lambda a: a.utility, reverse=True)
     print("\n===== Final Optimized Outputs =====")
@@ -75,7 +81,12 @@ SOP_TEMPLATES = {
 
 
 
-def run_stage(agents, task_input, stage_name, max_rounds=5):
+@profiled("dcc_stage")
+def run_stage(agents, task_input, stage_name, max_rounds=5, topology=None):
+    """
+    topology: CommunicationTopology deciding which peers each agent sees per round (default: all-to-all).
+    """
+    topology = topology or CommunicationTopology("full")
     message_pool = {}
     for agent in agents:
         proposal = agent.generate_initial_proposal(task_input)
@@ -86,8 +97,9 @@ def run_stage(agents, task_input, stage_name, max_rounds=5):
     for round_num in range(max_rounds):
         print(f"--- {stage_name} Round {round_num + 1} ---")
         converged = True
+        graph = topology.build(message_pool, {a.name: a.utility for a in agents}, round_num)
         for agent in agents:
-            peers = [p for name, p in message_pool.items() if name != agent.name]
+            peers = topology.deliver(graph, agent.name, message_pool)
             prev_util = agent.utility
             refined = agent.refine_proposal(peers)
             message_pool[agent.name] = refined
@@ -97,6 +109,7 @@ def run_stage(agents, task_input, stage_name, max_rounds=5):
         if converged:
             print(f"[{stage_name}] Converged.")
             break
+    print(f"[{stage_name}] {topology.summary()}")
 
     # Select the best agent proposal
     best_agent = max(agents, key=lambda a: a.utility)
@@ -0,0 +1,200 @@
+"""
+Per-phase timing spans and counters for CAB and DCC runs.
+Profiling is off by default: `span` then hands out a shared no-op context and
+`profiled` wrappers call straight through, so instrumented code pays one
+attribute check per call. Results export as folded stacks (flamegraph.pl /
+speedscope input) and as Prometheus text, optionally served on localhost.
+"""
+import functools
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._push(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler._pop()
+        return False
+
+
+class Profiler:
+    """
+    Collects inclusive time per phase, self time per call stack and labelled counters.
+    Span stacks are tracked per thread.
+    """
+    def __init__(self):
+        self.enabled = False
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.phase_seconds = defaultdict(float)  # phase -> inclusive seconds
+            self.phase_calls = defaultdict(int)      # phase -> number of spans
+            self.stack_seconds = defaultdict(float)  # "cab_stage;score" -> self seconds
+            self.counters = defaultdict(float)       # (name, labels) -> value
+
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _push(self, name):
+        # [name, start time, time spent in child spans]
+        self._stack().append([name, time.perf_counter(), 0.0])
+
+    def _pop(self):
+        stack = self._stack()
+        name, start, child_seconds = stack[-1]
+        elapsed = time.perf_counter() - start
+        folded = ";".join(frame[0] for frame in stack)
+        stack.pop()
+        if stack:
+            stack[-1][2] += elapsed
+        with self._lock:
+            self.phase_seconds[name] += elapsed
+            self.phase_calls[name] += 1
+            self.stack_seconds[folded] += elapsed - child_seconds
+
+    def incr(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] += value
+
+    def export_folded(self, path):
+        """
+        Write self time per call stack as "a;b;c <microseconds>" lines.
+        """
+        with self._lock:
+            lines = [f"{stack} {int(seconds * 1e6)}" for stack, seconds in sorted(self.stack_seconds.items())]
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def prometheus_text(self):
+        """
+        Render phases and counters in the Prometheus text exposition format.
+        """
+        with self._lock:
+            phase_seconds = dict(self.phase_seconds)
+            phase_calls = dict(self.phase_calls)
+            counters = dict(self.counters)
+        lines = [
+            "# TYPE c3_phase_seconds_total counter",
+            *[f'c3_phase_seconds_total{{phase="{p}"}} {s:.6f}' for p, s in sorted(phase_seconds.items())],
+            "# TYPE c3_phase_calls_total counter",
+            *[f'c3_phase_calls_total{{phase="{p}"}} {n}' for p, n in sorted(phase_calls.items())],
+        ]
+        declared = set()
+        for (name, labels), value in sorted(counters.items()):
+            metric = f"c3_{name}_total"
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} counter")
+                declared.add(metric)
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{metric}{{{label_text}}} {value:g}" if label_text else f"{metric} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def serve_metrics(self, port=9464, host="127.0.0.1"):
+        """
+        Serve `prometheus_text()` at http://host:port/metrics from a daemon thread.
+        Returns the server; call .shutdown() to stop it.
+        """
+        profiler = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = profiler.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+PROFILER = Profiler()
+
+
+def enable():
+    PROFILER.enabled = True
+
+
+def disable():
+    PROFILER.enabled = False
+
+
+def span(name):
+    """
+    Context manager timing one phase, e.g. `with span("score"): ...`.
+    """
+    return PROFILER.span(name)
+
+
+def incr(name, value=1, **labels):
+    PROFILER.incr(name, value, **labels)
+
+
+def profiled(name):
+    """
+    Decorator timing every call of the wrapped function as phase `name`.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            with _Span(PROFILER, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_usage(response, phase):
+    """
+    Count one LLM call for `phase` and its token usage when the provider reports it.
+    """
+    if not PROFILER.enabled:
+        return
+    PROFILER.incr("llm_calls", phase=phase)
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        PROFILER.incr("prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0, phase=phase)
+        PROFILER.incr("completion_tokens", getattr(usage, "completion_tokens", 0) or 0, phase=phase)
@@ -5,11 +5,13 @@ class Proposal:
     """
     Represents a proposal submitted by an agent, with associated metadata and metrics.
     """
-    def __init__(self, agent_name: str, content: str, version: int = 0):
+    def __init__(self, agent_name: str, content: str, version: int = 0, aborted: bool = False):
         self.agent_name = agent_name
         self.content = content
+        self.aborted = aborted  # generation stopped early; not scored
         self.score: Optional[float] = None
         self.metrics: dict = {}
+        self.metric_variance: dict = {}
         self.version: int = version
         self.timestamp: float = time.time()
 
@@ -0,0 +1,263 @@
+"""
+Model routing per call type with optional small-to-large cascades.
+Tiers and routes are read from the `routing` section of config.yaml; without
+one, every call type goes to the single `llm` model.
+"""
+import math
+import os
+import threading
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+import yaml
+from openai import BadRequestError, OpenAI
+
+from profiling import incr, record_usage
+
+CALL_TYPES = ("generate", "refine", "score", "feedback", "peer_eval", "evolve")
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.yaml")
+
+
+class ModelTier:
+    """
+    One model endpoint with its pricing and per-tier statistics.
+    """
+    def __init__(self, name: str, model: str, base_url: Optional[str] = None, api_key: Optional[str] = None,
+                 price_per_1k_input: float = 0.0, price_per_1k_output: float = 0.0,
+                 min_confidence: Optional[float] = None, json_mode: bool = False):
+        """
+        min_confidence: when this tier is not last in a cascade, escalate if the mean
+            token probability of its answer (from logprobs) falls below this value.
+        json_mode: the provider supports response_format={"type": "json_object"};
+            switched off automatically if the provider rejects it.
+        """
+        self.name = name
+        self.model = model
+        self.client = OpenAI(base_url=base_url, api_key=api_key)
+        self.price_per_1k_input = price_per_1k_input
+        self.price_per_1k_output = price_per_1k_output
+        self.min_confidence = min_confidence
+        self.json_mode = json_mode
+        self.stats = {"calls": 0, "failures": 0, "escalations": 0, "seconds": 0.0, "cost": 0.0}
+
+    def cost(self, response) -> float:
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return 0.0
+        return ((getattr(usage, "prompt_tokens", 0) or 0) * self.price_per_1k_input
+                + (getattr(usage, "completion_tokens", 0) or 0) * self.price_per_1k_output) / 1000
+
+
+def response_confidence(response) -> Optional[float]:
+    """
+    Mean token probability of the first choice, or None if logprobs are unavailable.
+    """
+    logprobs = getattr(response.choices[0], "logprobs", None)
+    tokens = getattr(logprobs, "content", None) if logprobs is not None else None
+    if not tokens:
+        return None
+    return math.exp(sum(t.logprob for t in tokens) / len(tokens))
+
+
+class RecordedStream:
+    """
+    Wraps a streamed completion and records the call, with the usage reported in
+    its final chunk, once the stream is exhausted or closed. If the provider
+    reports no usage, completion tokens are estimated from the content chunks.
+    """
+    def __init__(self, router: "ModelRouter", tier: ModelTier, call_type: str, stream, start: float):
+        self._router = router
+        self._tier = tier
+        self._call_type = call_type
+        self._stream = stream
+        self._start = start
+        self._usage = None
+        self._chunks = 0
+        self._done = False
+
+    def __iter__(self):
+        for chunk in self._stream:
+            if getattr(chunk, "usage", None) is not None:
+                self._usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                self._chunks += 1
+            yield chunk
+        self._finish()
+
+    def close(self):
+        close = getattr(self._stream, "close", None)
+        if close:
+            close()
+        self._finish()
+
+    def _finish(self):
+        if self._done:
+            return
+        self._done = True
+        usage = self._usage or SimpleNamespace(prompt_tokens=0, completion_tokens=self._chunks)
+        self._router._record(self._tier, self._call_type, time.perf_counter() - self._start,
+                             SimpleNamespace(usage=usage))
+
+
+class ModelRouter:
+    """
+    Maps each call type to a cascade of tiers, cheapest first. A tier's answer is
+    accepted unless the call fails, its confidence is too low or `validate` rejects
+    it, in which case the call escalates to the next tier. The last tier's answer
+    is always returned.
+    """
+    def __init__(self, tiers: Dict[str, ModelTier], routes: Dict[str, List[str]], default_route: List[str]):
+        self.tiers = tiers
+        self.routes = routes
+        self.default_route = default_route
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, path: str = DEFAULT_CONFIG_PATH) -> "ModelRouter":
+        with open(path, "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f) or {}
+        llm = config.get("llm", {})
+        routing = config.get("routing") or {}
+        tier_configs = routing.get("tiers") or {"default": {"model": llm.get("model", "gpt-4o-2024-05-13")}}
+        tiers = {}
+        for name, tier in tier_configs.items():
+            tiers[name] = ModelTier(
+                name,
+                tier["model"],
+                base_url=tier.get("base_url", llm.get("base_url")),
+                api_key=tier.get("api_key", llm.get("api_key")),
+                price_per_1k_input=tier.get("price_per_1k_input", 0.0),
+                price_per_1k_output=tier.get("price_per_1k_output", 0.0),
+                min_confidence=tier.get("min_confidence"),
+                json_mode=tier.get("json_mode", False),
+            )
+        default_route = routing.get("default")
+        if default_route is None:
+            default_route = [list(tiers)[-1]]
+        routes = routing.get("routes") or {}
+        for call_type, route in [("default", default_route)] + list(routes.items()):
+            if not route:
+                raise ValueError(f"Empty routing cascade for '{call_type}' in {path}")
+            unknown = [name for name in route if name not in tiers]
+            if unknown:
+                raise ValueError(f"Routing cascade for '{call_type}' in {path} uses unknown tiers {unknown}, "
+                                 f"expected names from {list(tiers)}")
+        return cls(tiers, routes, default_route)
+
+    def cascade(self, call_type: str) -> List[ModelTier]:
+        return [self.tiers[name] for name in self.routes.get(call_type, self.default_route)]
+
+    def total_calls(self) -> int:
+        """
+        Calls made on all tiers so far, failed and escalated ones included.
+        """
+        with self._lock:
+            return sum(tier.stats["calls"] for tier in self.tiers.values())
+
+    def _record(self, tier: ModelTier, call_type: str, seconds: float, response=None, failed=False):
+        with self._lock:
+            tier.stats["calls"] += 1
+            tier.stats["seconds"] += seconds
+            if failed:
+                tier.stats["failures"] += 1
+            else:
+                tier.stats["cost"] += tier.cost(response)
+        incr("tier_calls", tier=tier.name, call_type=call_type)
+        if response is not None:
+            record_usage(response, call_type)
+
+    def _escalate(self, tier: ModelTier, call_type: str, reason: str):
+        with self._lock:
+            tier.stats["escalations"] += 1
+        incr("escalations", tier=tier.name, call_type=call_type, reason=reason)
+
+    def create(self, call_type: str, messages: list, **kwargs):
+        """
+        Raw single-tier completion on the cascade's final tier (used for streaming,
+        where a cheap answer cannot be validated before it is shown). Streams are
+        returned as a RecordedStream that records cost and usage when consumed.
+        """
+        tier = self.cascade(call_type)[-1]
+        if kwargs.get("stream"):
+            kwargs.setdefault("stream_options", {"include_usage": True})
+        start = time.perf_counter()
+        try:
+            response = tier.client.chat.completions.create(model=tier.model, messages=messages, **kwargs)
+        except Exception:
+            self._record(tier, call_type, time.perf_counter() - start, failed=True)
+            raise
+        if kwargs.get("stream"):
+            return RecordedStream(self, tier, call_type, response, start)
+        self._record(tier, call_type, time.perf_counter() - start, response)
+        return response
+
+    def _call_tier(self, tier: ModelTier, messages: list, json_mode: bool, **request):
+        if json_mode and tier.json_mode:
+            try:
+                return tier.client.chat.completions.create(
+                    model=tier.model, messages=messages, response_format={"type": "json_object"}, **request)
+            except BadRequestError as e:
+                # Only a rejection of response_format itself disables JSON mode; any other
+                # failure propagates so the cascade escalates as usual.
+                if "response_format" not in str(e) and "json" not in str(e).lower():
+                    raise
+                print(f"[Fallback] {tier.name} rejected JSON mode, retrying without it: {e}")
+                tier.json_mode = False
+        return tier.client.chat.completions.create(model=tier.model, messages=messages, **request)
+
+    def complete(self, call_type: str, messages: list, validate: Optional[Callable[[str], bool]] = None,
+                 json_mode: bool = False, final_only: bool = False, **kwargs) -> str:
+        """
+        Run the cascade for `call_type` and return the accepted answer text.
+        json_mode: request the provider's JSON response format on tiers that support it.
+        final_only: skip the cheaper tiers and call only the cascade's final tier.
+        """
+        cascade = self.cascade(call_type)
+        if final_only:
+            cascade = cascade[-1:]
+        for position, tier in enumerate(cascade):
+            last = position == len(cascade) - 1
+            request = dict(kwargs)
+            if tier.min_confidence is not None and not last:
+                request["logprobs"] = True
+            start = time.perf_counter()
+            try:
+                response = self._call_tier(tier, messages, json_mode, **request)
+            except Exception:
+                self._record(tier, call_type, time.perf_counter() - start, failed=True)
+                if last:
+                    raise
+                self._escalate(tier, call_type, "error")
+                continue
+            self._record(tier, call_type, time.perf_counter() - start, response)
+            text = response.choices[0].message.content.strip()
+            if last:
+                return text
+            if tier.min_confidence is not None:
+                confidence = response_confidence(response)
+                if confidence is not None and confidence < tier.min_confidence:
+                    self._escalate(tier, call_type, "confidence")
+                    continue
+            if validate is not None and not validate(text):
+                self._escalate(tier, call_type, "validation")
+                continue
+            return text
+
+    def report(self) -> str:
+        """
+        Per-tier latency, cost and escalation rate.
+        """
+        lines = []
+        for tier in self.tiers.values():
+            s = tier.stats
+            calls = s["calls"]
+            avg = s["seconds"] / calls if calls else 0.0
+            rate = s["escalations"] / calls if calls else 0.0
+            lines.append(f"[Router:{tier.name}] {tier.model}: {calls} calls, {s['failures']} failed, "
+                         f"avg {avg:.2f}s, cost ${s['cost']:.4f}, escalation rate {rate:.0%}")
+        return "\n".join(lines)
+
+
+# Shared by agents and the auction coordinator so per-tier statistics cover the whole run.
+default_router = ModelRouter.from_config()
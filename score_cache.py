@@ -0,0 +1,149 @@
+"""
+Cross-run memoization and drift calibration for LLM proposal scores.
+Scores are keyed by (proposal hash, task hash, rubric version) so unchanged
+proposals, e.g. winners carried across iterations, are never re-scored.
+"""
+import hashlib
+import json
+import math
+import os
+from typing import Dict, Optional
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class ScoreCache:
+    """
+    Score memo persisted as JSON so it can be reused across runs.
+    Each entry stores the averaged metrics, their variance and the sample count.
+    Inserts only touch memory; call `save()` (the coordinator does so once per round) to persist.
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        self.previous_run = set(self.entries)  # keys loaded from disk and not re-scored since
+
+    @staticmethod
+    def make_key(proposal: str, task_description: str, rubric_version: str) -> str:
+        return f"{rubric_version}:{content_hash(task_description)}:{content_hash(proposal)}"
+
+    def get(self, proposal: str, task_description: str, rubric_version: str,
+            min_samples: int = 1) -> Optional[dict]:
+        """
+        Memoized entry, or None. Entries averaged over fewer than `min_samples`
+        samples count as misses so multi-sample scoring is not bypassed.
+        """
+        entry = self.entries.get(self.make_key(proposal, task_description, rubric_version))
+        if entry is not None and entry["samples"] < min_samples:
+            entry = None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def from_previous_run(self, proposal: str, task_description: str, rubric_version: str) -> bool:
+        return self.make_key(proposal, task_description, rubric_version) in self.previous_run
+
+    def put(self, proposal: str, task_description: str, rubric_version: str,
+            metrics: dict, variance: dict, samples: int):
+        key = self.make_key(proposal, task_description, rubric_version)
+        self.entries[key] = {
+            "metrics": metrics,
+            "variance": variance,
+            "samples": samples,
+        }
+        self.previous_run.discard(key)
+        self.dirty = True
+
+    def save(self):
+        """
+        Atomically write the memo to `path` if it changed since the last save.
+        """
+        if not self.dirty:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return f"<ScoreCache(n={len(self.entries)}, hits={self.hits}, misses={self.misses})>"
+
+
+def _mean_std(values):
+    mean = sum(values) / len(values)
+    var = sum((v - mean) ** 2 for v in values) / len(values)
+    return mean, math.sqrt(var)
+
+
+class ScoreCalibrator:
+    """
+    Normalizes per-run score drift: once enough fresh scores have been seen in
+    this run, each metric is z-scored against the run's own distribution and
+    mapped onto the reference distribution (by default, all scores in the cache
+    from previous runs), then clipped to the 1-10 rubric range. Scores memoized
+    by previous runs are already on the reference scale and are not calibrated.
+    The run distribution is frozen between rounds: scores observed during a round
+    only take effect after `end_round()`, so every proposal in a round is
+    calibrated on the same scale.
+    """
+    def __init__(self, reference: Optional[Dict[str, tuple]] = None, min_samples: int = 5):
+        """
+        reference: {metric: (mean, std)}; metrics without a reference are left raw.
+        min_samples: fresh scores needed before a metric is calibrated.
+        """
+        self.reference = reference or {}
+        self.min_samples = min_samples
+        self.observed: Dict[str, list] = {}  # metric -> scores from completed rounds
+        self.pending: Dict[str, list] = {}   # metric -> scores from the current round
+        self.run_stats: Dict[str, tuple] = {}  # metric -> frozen (mean, std)
+
+    @classmethod
+    def from_cache(cls, cache: ScoreCache, min_samples: int = 5):
+        values: Dict[str, list] = {}
+        for entry in cache.entries.values():
+            for metric, value in entry["metrics"].items():
+                values.setdefault(metric, []).append(value)
+        reference = {m: _mean_std(v) for m, v in values.items() if len(v) >= min_samples}
+        return cls(reference, min_samples)
+
+    def observe(self, metrics: dict):
+        for metric, value in metrics.items():
+            self.pending.setdefault(metric, []).append(value)
+
+    def end_round(self):
+        """
+        Fold the current round's scores into the run distribution and refreeze its statistics.
+        """
+        for metric, values in self.pending.items():
+            self.observed.setdefault(metric, []).extend(values)
+        self.pending = {}
+        self.run_stats = {m: _mean_std(v) for m, v in self.observed.items() if len(v) >= self.min_samples}
+
+    def calibrate(self, metrics: dict) -> dict:
+        calibrated = {}
+        for metric, value in metrics.items():
+            if metric not in self.reference or metric not in self.run_stats:
+                calibrated[metric] = value
+                continue
+            run_mean, run_std = self.run_stats[metric]
+            ref_mean, ref_std = self.reference[metric]
+            if run_std == 0:
+                shifted = ref_mean + (value - run_mean)
+            else:
+                shifted = ref_mean + (value - run_mean) * ref_std / run_std
+            calibrated[metric] = min(10.0, max(1.0, shifted))
+        return calibrated
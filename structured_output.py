@@ -0,0 +1,217 @@
+"""
+Structured (JSON) output for LLM calls.
+Replies are parsed with a tolerant, incremental extractor that pulls the first
+valid JSON object out of noisy or streamed text (code fences, preambles,
+trailing commentary), validated against a small per-call schema, and repaired
+with one cheap retry only when extraction fails. Parse outcomes are tracked
+per call name.
+"""
+import json
+import math
+import threading
+from collections import defaultdict
+from typing import Dict, Optional
+
+from profiling import incr
+
+
+class StructuredOutputError(Exception):
+    """
+    Raised when no schema-valid JSON object could be obtained.
+    """
+
+
+class JsonObjectExtractor:
+    """
+    Incremental scanner returning the first complete, parseable JSON object.
+    Feed it text chunks as they arrive; `feed` returns the object once found.
+    """
+    def __init__(self):
+        self.buffer = ""
+        self.result: Optional[dict] = None
+        self._pos = 0
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def _reset_scan(self, pos):
+        self._pos = pos
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> Optional[dict]:
+        if self.result is not None:
+            return self.result
+        self.buffer += chunk
+        while self._pos < len(self.buffer):
+            ch = self.buffer[self._pos]
+            self._pos += 1
+            if self._start < 0:
+                if ch == "{":
+                    self._start, self._depth = self._pos - 1, 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        candidate = json.loads(self.buffer[self._start:self._pos])
+                    except ValueError:
+                        candidate = None
+                    if isinstance(candidate, dict):
+                        self.result = candidate
+                        return candidate
+                    # Not an object after all: rescan from just after this opening brace.
+                    self._reset_scan(self._start + 1)
+        return None
+
+
+def extract_json(text: str) -> Optional[dict]:
+    """
+    First valid JSON object in `text`, or None.
+    """
+    return JsonObjectExtractor().feed(text)
+
+
+def validate_schema(obj: dict, schema: Dict[str, dict]) -> dict:
+    """
+    Check `obj` against {field: {"type": "number" | "string" | "boolean", "min": .., "max": ..}}.
+    Numeric strings are coerced to float; NaN and infinities are rejected. Returns the normalized object with only schema fields;
+    raises StructuredOutputError on the first violation.
+    """
+    normalized = {}
+    for field, rule in schema.items():
+        if field not in obj:
+            raise StructuredOutputError(f"missing field '{field}'")
+        value = obj[field]
+        kind = rule.get("type", "number")
+        if kind == "number":
+            if isinstance(value, bool):
+                raise StructuredOutputError(f"field '{field}' is not a number: {value!r}")
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                raise StructuredOutputError(f"field '{field}' is not a number: {value!r}")
+            if not math.isfinite(value):
+                raise StructuredOutputError(f"field '{field}' is not finite: {value!r}")
+            if "min" in rule and value < rule["min"] or "max" in rule and value > rule["max"]:
+                raise StructuredOutputError(f"field '{field}' out of range: {value}")
+        elif kind == "string" and not isinstance(value, str):
+            raise StructuredOutputError(f"field '{field}' is not a string: {value!r}")
+        elif kind == "boolean" and not isinstance(value, bool):
+            raise StructuredOutputError(f"field '{field}' is not a boolean: {value!r}")
+        normalized[field] = value
+    return normalized
+
+
+def parse_structured(text: str, schema: Dict[str, dict]):
+    """
+    Parse a reply into a schema-valid dict.
+    Returns (obj, "direct" | "extracted"); raises StructuredOutputError otherwise.
+    """
+    try:
+        obj = json.loads(text)
+        outcome = "direct"
+    except ValueError:
+        obj = None
+    if not isinstance(obj, dict):
+        # Not JSON, or JSON that is not an object (e.g. a list wrapping one).
+        obj = extract_json(text)
+        outcome = "extracted"
+    if not isinstance(obj, dict):
+        raise StructuredOutputError("no JSON object found in reply")
+    return validate_schema(obj, schema), outcome
+
+
+class ParseStats:
+    """
+    Per-call-name counts of parse outcomes. Each call ends as direct, extracted,
+    repaired or failed; replies rejected on a cheaper cascade tier before that are
+    counted as rejected_tier.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = defaultdict(lambda: defaultdict(int))
+
+    def record(self, name: str, outcome: str):
+        with self._lock:
+            self.counts[name][outcome] += 1
+        incr("structured_output", call=name, outcome=outcome)
+
+    def failure_rate(self, name: str) -> float:
+        """
+        Share of replies that could not be parsed: tier rejections plus calls whose
+        final cascade reply needed a repair (repaired or failed).
+        """
+        counts = self.counts.get(name, {})
+        total = sum(counts.values())
+        bad = counts.get("rejected_tier", 0) + counts.get("repaired", 0) + counts.get("failed", 0)
+        return bad / total if total else 0.0
+
+    def report(self) -> str:
+        lines = []
+        for name, counts in sorted(self.counts.items()):
+            summary = ", ".join(f"{outcome}: {n}" for outcome, n in sorted(counts.items()))
+            lines.append(f"[Structured:{name}] {summary} (parse failure rate {self.failure_rate(name):.0%})")
+        return "\n".join(lines)
+
+
+PARSE_STATS = ParseStats()
+
+
+def call_json(router, call_type: str, messages: list, schema: Dict[str, dict], name: Optional[str] = None) -> dict:
+    """
+    Run a JSON-returning call through `router` (provider JSON mode where available),
+    parse and validate the reply, and on failure make one repair request to the
+    cascade's final tier that shows the model its invalid reply. Raises
+    StructuredOutputError if that fails too.
+    """
+    name = name or call_type
+
+    def is_valid(text):
+        # Only consulted for tiers before the last; a rejection escalates the cascade.
+        try:
+            parse_structured(text, schema)
+            return True
+        except StructuredOutputError:
+            PARSE_STATS.record(name, "rejected_tier")
+            return False
+
+    text = router.complete(call_type, messages, validate=is_valid, json_mode=True)
+    try:
+        obj, outcome = parse_structured(text, schema)
+        PARSE_STATS.record(name, outcome)
+        return obj
+    except StructuredOutputError as e:
+        error = e
+
+    repair_messages = messages + [
+        {"role": "assistant", "content": text},
+        {"role": "user", "content": (
+            f"Your reply could not be used ({error}). Respond with ONLY a JSON object "
+            f"with the fields {', '.join(schema)}, and nothing else."
+        )},
+    ]
+    # A reply that reaches this point came from the final tier: cheaper tiers' invalid replies
+    # escalate instead of returning. So the repair is one request to the tier that produced it.
+    repaired = router.complete(call_type, repair_messages, json_mode=True, final_only=True)
+    try:
+        obj, _ = parse_structured(repaired, schema)
+    except StructuredOutputError:
+        PARSE_STATS.record(name, "failed")
+        raise
+    PARSE_STATS.record(name, "repaired")
+    return obj
@@ -0,0 +1,124 @@
+"""
+Sparse communication topologies for DCC.
+A topology decides, once per round, which peers' proposals each agent sees,
+so prompt size and call count no longer grow quadratically with agent count.
+"""
+import random
+import re
+from typing import Dict, List, Optional
+
+TOPOLOGIES = ("full", "ring", "knn", "small_world", "top_k", "gossip")
+WORD_RE = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (~4 characters per token), good enough for volume accounting.
+    """
+    return max(1, len(text) // 4) if text else 0
+
+
+def jaccard_similarity(a: set, b: set) -> float:
+    if not a and not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class CommunicationTopology:
+    """
+    Builds the per-round "who sees whom" graph and accounts message and token volume
+    against the all-to-all baseline.
+    """
+    def __init__(self, kind: str = "full", k: int = 2, rewire_prob: float = 0.1, seed: Optional[int] = None):
+        """
+        kind: one of TOPOLOGIES.
+        k: peers per agent for ring (k nearest on the ring), knn, small_world, top_k and gossip.
+        rewire_prob: probability of rewiring each ring edge to a random peer (small_world).
+        seed: makes small_world and gossip graphs reproducible per round.
+        """
+        if kind not in TOPOLOGIES:
+            raise ValueError(f"Unknown topology '{kind}', expected one of {TOPOLOGIES}")
+        self.kind = kind
+        self.k = max(1, k)
+        self.rewire_prob = rewire_prob
+        self.seed = seed
+        self.stats = {"rounds": 0, "messages": 0, "tokens": 0, "full_messages": 0, "full_tokens": 0}
+
+    def build(self, proposals: Dict[str, str], scores: Optional[Dict[str, float]] = None,
+              round_num: int = 0) -> Dict[str, List[str]]:
+        """
+        Called once per round.
+        proposals: {agent_name: proposal text} at the start of the round.
+        scores: {agent_name: score}, required by top_k.
+        Returns {agent_name: [peer names this agent sees this round]}.
+        """
+        names = list(proposals)
+        n = len(names)
+        k = min(self.k, n - 1)
+        self.stats["rounds"] += 1
+        if n < 2:
+            return {name: [] for name in names}
+        rng = random.Random(None if self.seed is None else f"{self.seed}:{round_num}")
+
+        if self.kind == "full":
+            return {name: [p for p in names if p != name] for name in names}
+
+        if self.kind in ("ring", "small_world"):
+            graph = {}
+            offsets = [d for step in range(1, k // 2 + 2) for d in (step, -step)][:k]
+            for i, name in enumerate(names):
+                peers = [names[(i + offset) % n] for offset in offsets]
+                if self.kind == "small_world":
+                    # Rewire edge by edge to a node outside the current peer set, keeping degree k.
+                    for j in range(len(peers)):
+                        if rng.random() < self.rewire_prob:
+                            choices = [p for p in names if p != name and p not in peers]
+                            if choices:
+                                peers[j] = rng.choice(choices)
+                graph[name] = peers
+            return graph
+
+        if self.kind == "knn":
+            words = {name: set(WORD_RE.findall(proposals[name].lower())) for name in names}
+            graph = {}
+            for name in names:
+                ranked = sorted((p for p in names if p != name),
+                                key=lambda p: jaccard_similarity(words[name], words[p]), reverse=True)
+                graph[name] = ranked[:k]
+            return graph
+
+        if self.kind == "top_k":
+            scores = scores or {}
+            ranked = sorted(names, key=lambda p: scores.get(p, 0.0), reverse=True)
+            return {name: [p for p in ranked if p != name][:k] for name in names}
+
+        # gossip
+        return {name: rng.sample([p for p in names if p != name], k) for name in names}
+
+    def deliver(self, graph: Dict[str, List[str]], agent_name: str, proposals: Dict[str, str]) -> List[str]:
+        """
+        Peer proposal texts `agent_name` receives, read from `proposals` at delivery time
+        (DCC updates the pool as agents refine within a round). Each delivered text is
+        accounted against what all-to-all would have sent from the same pool.
+        """
+        delivered = [proposals[p] for p in graph.get(agent_name, [])]
+        self.stats["messages"] += len(delivered)
+        self.stats["tokens"] += sum(estimate_tokens(text) for text in delivered)
+        self.stats["full_messages"] += len(proposals) - 1
+        self.stats["full_tokens"] += sum(estimate_tokens(text) for name, text in proposals.items()
+                                         if name != agent_name)
+        return delivered
+
+    def summary(self) -> str:
+        s = self.stats
+        ratio = s["tokens"] / s["full_tokens"] if s["full_tokens"] else 1.0
+        return (f"[Topology:{self.kind}] {s['rounds']} rounds, {s['messages']} messages "
+                f"(all-to-all: {s['full_messages']}), ~{s['tokens']} peer tokens "
+                f"(all-to-all: ~{s['full_tokens']}, {ratio:.0%})")
+
+
+def peer_subset(graph: Dict[str, List[str]], agent_name: str, proposals: Dict[str, str]) -> Dict[str, str]:
+    """
+    The {peer_name: proposal} dict an agent sees, e.g. for Agent.evaluate_peers.
+    """
+    return {peer: proposals[peer] for peer in graph.get(agent_name, [])}